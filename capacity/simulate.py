@@ -0,0 +1,1002 @@
+"""Offline capacity simulator for LANDERHub.
+
+Replays a recorded spawn/stop trace against the workspace resource specs in
+helm_chart_values and the node pool shapes in capacity/nodepools.yaml, and
+reports queue wait, autoscaler scale-ups, node-hours and utilisation for each
+config variant. Nothing here talks to the cluster.
+
+    python capacity/simulate.py --trace hub.log --variants capacity/variants.yaml
+    python capacity/simulate.py --trace trace.csv --set cull.timeout=1800
+
+Supported trace formats (see README.md for details):
+    csv / jsonl  rows of timestamp, user, event, workspace, inactive_seconds
+    hub-log      `kubectl logs deploy/hub` output, including the idle culler
+    users-api    JSON from GET /hub/api/users, one snapshot or one per line
+"""
+
+import argparse
+import copy
+import csv
+import heapq
+import json
+import math
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_VALUES = [
+    REPO_DIR / "helm_chart_values" / "cull.yaml",
+    REPO_DIR / "helm_chart_values" / "singleuser.yaml",
+    REPO_DIR / "helm_chart_values" / "workspaces.yaml",
+]
+DEFAULT_NODEPOOLS = REPO_DIR / "capacity" / "nodepools.yaml"
+
+# z2jh chart defaults for scheduling.userPods.tolerations
+# https://zero-to-jupyterhub.readthedocs.io/en/latest/resources/reference.html#scheduling-userpods-tolerations
+Z2JH_USER_POD_TOLERATIONS = [
+    {
+        "key": "hub.jupyter.org/dedicated",
+        "operator": "Equal",
+        "value": "user",
+        "effect": "NoSchedule",
+    },
+    {
+        "key": "hub.jupyter.org_dedicated",
+        "operator": "Equal",
+        "value": "user",
+        "effect": "NoSchedule",
+    },
+]
+
+# Same suffixes as jupyterhub's ByteSpecification, plus the Kubernetes "Gi" forms
+BYTE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+TRACE_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".log": "hub-log",
+    ".txt": "hub-log",
+    ".json": "users-api",
+}
+
+
+# =============================================================================
+# Config loading
+# =============================================================================
+
+
+def parse_bytes(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)i?B?\s*", str(value))
+    if not match:
+        raise ValueError(f"Cannot parse memory size {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * BYTE_UNITS[unit])
+
+
+def deep_merge(base: dict, other: dict) -> dict:
+    for key, value in other.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            deep_merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_config(values_files, nodepools_file) -> dict:
+    config = {}
+    for path in [*values_files, nodepools_file]:
+        with open(path) as f:
+            deep_merge(config, yaml.safe_load(f) or {})
+    return config
+
+
+def apply_overrides(config: dict, overrides: dict) -> dict:
+    # deepcopy keeps YAML anchors shared, so overriding an environment
+    # changes every workspace that references it.
+    config = copy.deepcopy(config)
+    for dotted_key, value in (overrides or {}).items():
+        *parents, leaf = dotted_key.split(".")
+        node = config
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = value
+    return config
+
+
+def get_config(config: dict, dotted_key: str, default=None):
+    node = config
+    for key in dotted_key.split("."):
+        if not isinstance(node, dict) or key not in node:
+            return default
+        node = node[key]
+    return node
+
+
+# =============================================================================
+# Trace loading
+# =============================================================================
+
+
+@dataclass
+class TraceEvent:
+    time: float
+    kind: str  # "start", "activity" or "stop"
+    user: str
+    workspace: Optional[str] = None
+    # For starts whose session ends in a recorded stop: the user was working
+    # until then, even if the trace has no activity in between.
+    active_until: float = 0.0
+
+
+def parse_time(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _rows_to_events(rows, cull_timeout: float) -> list:
+    events = []
+    for row in rows:
+        t = parse_time(row["timestamp"])
+        user = row["user"]
+        kind = row["event"].strip().lower()
+        workspace = row.get("workspace") or None
+        if kind == "cull":
+            # The culler decides when the pod goes away in each variant, so
+            # only keep the time the user was last active.
+            inactive = row.get("inactive_seconds")
+            inactive = float(inactive) if inactive not in (None, "") else cull_timeout
+            events.append(TraceEvent(t - inactive, "activity", user))
+        elif kind in ("start", "activity", "stop"):
+            events.append(TraceEvent(t, kind, user, workspace))
+        else:
+            raise ValueError(f"Unknown trace event {kind!r} for user {user}")
+    return events
+
+
+def read_csv_trace(path, cull_timeout: float) -> list:
+    with open(path, newline="") as f:
+        return _rows_to_events(csv.DictReader(f), cull_timeout)
+
+
+def read_jsonl_trace(path, cull_timeout: float) -> list:
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return _rows_to_events(rows, cull_timeout)
+
+
+# JupyterHub logs "[I 2023-01-10 10:00:00.123 JupyterHub base:1050] ..."
+# and the idle culler logs "[I 230110 10:00:00 __init__:123] ..."
+LOG_PREFIX = re.compile(
+    r"^\[[A-Z] (?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?"
+    r"|\d{6} \d{2}:\d{2}:\d{2})[^\]]*\]\s*(?P<msg>.*)$"
+)
+LOG_WORKSPACE = re.compile(r"User (?P<user>\S+) requested workspace '(?P<ws>[^']*)'")
+LOG_START = re.compile(r"User (?P<user>\S+) took (?P<secs>[\d.]+) seconds to start")
+LOG_STOP = re.compile(r"User (?P<user>\S+) server took [\d.]+ seconds to stop")
+LOG_CULL = re.compile(
+    r"Culling server (?P<user>\S+) \(inactive for (?P<h>\d+):(?P<m>\d+):(?P<s>\d+)\)"
+)
+
+
+def _log_time(value: str) -> float:
+    fmt = "%Y-%m-%d %H:%M:%S" if "-" in value else "%y%m%d %H:%M:%S"
+    value, _, fraction = value.partition(".")
+    dt = datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+    return dt.timestamp() + float(f"0.{fraction or 0}")
+
+
+def read_hub_log_trace(path, cull_timeout: float) -> list:
+    events = []
+    requested = set()
+    culled = set()
+    with open(path, errors="replace") as f:
+        for line in f:
+            prefix = LOG_PREFIX.match(line.strip())
+            if not prefix:
+                continue
+            t = _log_time(prefix["time"])
+            msg = prefix["msg"]
+
+            if match := LOG_WORKSPACE.search(msg):
+                # Logged by modify_pod_hook when the pod is requested, so spawns
+                # that later time out or fail are still part of the trace.
+                user = match["user"]
+                events.append(TraceEvent(t, "start", user, match["ws"] or None))
+                requested.add(user)
+            elif match := LOG_START.search(msg):
+                # Named servers are logged as "user:server"
+                user = match["user"].split(":")[0]
+                # Only needed for logs from before the workspace line was added
+                if user in requested:
+                    requested.discard(user)
+                else:
+                    start = t - float(match["secs"])
+                    events.append(TraceEvent(start, "start", user))
+            elif match := LOG_CULL.search(msg):
+                user = match["user"].split("/")[0]
+                inactive = int(match["h"]) * 3600 + int(match["m"]) * 60 + int(match["s"])
+                events.append(TraceEvent(t - inactive, "activity", user))
+                culled.add(user)
+            elif match := LOG_STOP.search(msg):
+                user = match["user"].split(":")[0]
+                requested.discard(user)
+                # Stops requested by the culler are replayed by the simulated culler
+                if user in culled:
+                    culled.discard(user)
+                else:
+                    events.append(TraceEvent(t, "stop", user))
+    return events
+
+
+def read_users_api_trace(path, cull_timeout: float) -> list:
+    with open(path) as f:
+        text = f.read()
+    try:
+        snapshots = [json.loads(text)]
+    except json.JSONDecodeError:
+        snapshots = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    # The API has no record of explicit stops, so every session is left for
+    # the simulated culler to end after its last activity.
+    sessions = {}
+    for snapshot in snapshots:
+        for user in snapshot:
+            for server_name, server in (user.get("servers") or {}).items():
+                if server_name or not server.get("started"):
+                    continue
+                key = (user["name"], server["started"])
+                last_activity = server.get("last_activity") or server["started"]
+                profile = (server.get("user_options") or {}).get("profile")
+                previous = sessions.get(key)
+                if previous is None or parse_time(last_activity) > parse_time(previous[0]):
+                    sessions[key] = (last_activity, profile)
+
+    events = []
+    for (user, started), (last_activity, profile) in sessions.items():
+        events.append(TraceEvent(parse_time(started), "start", user, profile))
+        events.append(TraceEvent(parse_time(last_activity), "activity", user))
+    return events
+
+
+TRACE_READERS = {
+    "csv": read_csv_trace,
+    "jsonl": read_jsonl_trace,
+    "hub-log": read_hub_log_trace,
+    "users-api": read_users_api_trace,
+}
+
+
+def read_trace(path, trace_format: Optional[str], cull_timeout: float) -> list:
+    path = Path(path)
+    if trace_format is None:
+        trace_format = TRACE_FORMATS.get(path.suffix.lower())
+        if trace_format is None:
+            raise ValueError(
+                f"Cannot infer trace format from {path.name}; use --trace-format."
+            )
+    events = TRACE_READERS[trace_format](path, cull_timeout)
+    events = sorted(events, key=_event_time)
+    mark_explicit_stops(events)
+    return events
+
+
+def _event_time(event: TraceEvent) -> float:
+    return event.time
+
+
+def mark_explicit_stops(events: list):
+    """Set active_until on starts that the user ended by stopping their server.
+
+    Without this the simulated culler would stop these servers cull.timeout
+    after they started, as the trace has no activity until the stop.
+    """
+    open_starts = {}
+    for event in events:
+        if event.kind == "start":
+            open_starts[event.user] = event
+        elif event.kind == "stop" and event.user in open_starts:
+            open_starts.pop(event.user).active_until = event.time
+
+
+# =============================================================================
+# Cluster model
+# =============================================================================
+
+
+@dataclass
+class PodSpec:
+    cpu: float
+    memory: int
+    extra: dict
+    node_selector: dict
+    tolerations: list
+
+
+def build_pod_spec(config: dict, workspace: Optional[str]) -> PodSpec:
+    """Resource requests KubeSpawner would make for a workspace.
+
+    kubespawner_override values replace the singleuser defaults, as they do
+    in jupyterhub_config_custom.py. Unknown workspaces fall back to the
+    workspace marked as default.
+    """
+    workspaces = get_config(config, "custom.workspaces", {}) or {}
+    if workspace not in workspaces:
+        workspace = next(
+            (k for k, ws in workspaces.items() if ws.get("default")), None
+        )
+    override = (workspaces.get(workspace) or {}).get("kubespawner_override") or {}
+
+    cpu = override.get("cpu_guarantee", get_config(config, "singleuser.cpu.guarantee", 0))
+    memory = override.get(
+        "mem_guarantee", get_config(config, "singleuser.memory.guarantee", 0)
+    )
+    extra = override.get(
+        "extra_resource_guarantees",
+        get_config(config, "singleuser.extraResource.guarantees", {}),
+    )
+    node_selector = override.get(
+        "node_selector", get_config(config, "singleuser.nodeSelector", {})
+    )
+    tolerations = override.get(
+        "tolerations",
+        get_config(config, "scheduling.userPods.tolerations", Z2JH_USER_POD_TOLERATIONS)
+        + get_config(config, "singleuser.extraTolerations", []),
+    )
+    return PodSpec(
+        cpu=float(cpu or 0),
+        memory=parse_bytes(memory or 0),
+        extra={k: float(v) for k, v in (extra or {}).items()},
+        node_selector=node_selector or {},
+        tolerations=tolerations or [],
+    )
+
+
+def tolerates(tolerations: list, taint: dict) -> bool:
+    if taint.get("effect") == "PreferNoSchedule":
+        return True
+    for toleration in tolerations:
+        operator = toleration.get("operator", "Equal")
+        if toleration.get("key") not in (None, taint["key"]):
+            continue
+        if operator == "Equal" and toleration.get("value") != taint.get("value"):
+            continue
+        if toleration.get("effect") not in (None, taint.get("effect")):
+            continue
+        return True
+    return False
+
+
+@dataclass
+class NodePool:
+    name: str
+    cpu: float
+    memory: int
+    extra: dict
+    labels: dict
+    taints: list
+    min_count: int
+    max_count: int
+    cost_per_hour: float
+    scale_up_seconds: float
+    scale_down_unneeded_seconds: float
+
+    def accepts(self, spec: PodSpec) -> bool:
+        if any(self.labels.get(k) != v for k, v in spec.node_selector.items()):
+            return False
+        if not all(tolerates(spec.tolerations, taint) for taint in self.taints):
+            return False
+        return (
+            spec.cpu <= self.cpu
+            and spec.memory <= self.memory
+            and all(v <= self.extra.get(k, 0) for k, v in spec.extra.items())
+        )
+
+
+def build_nodepools(config: dict) -> list:
+    autoscaler = config.get("autoscaler", {}) or {}
+    pools = []
+    for name, pool in (config.get("nodepools", {}) or {}).items():
+        pools.append(
+            NodePool(
+                name=name,
+                cpu=float(pool["cpu"]),
+                memory=parse_bytes(pool["memory"]),
+                extra={k: float(v) for k, v in (pool.get("extra_resources") or {}).items()},
+                labels=pool.get("labels") or {},
+                taints=pool.get("taints") or [],
+                min_count=int(pool.get("min_count", 0)),
+                max_count=int(pool.get("max_count", pool.get("min_count", 0))),
+                cost_per_hour=float(pool.get("cost_per_hour", 0)),
+                scale_up_seconds=float(
+                    pool.get("scale_up_seconds", autoscaler.get("scale_up_seconds", 300))
+                ),
+                scale_down_unneeded_seconds=float(
+                    pool.get(
+                        "scale_down_unneeded_seconds",
+                        autoscaler.get("scale_down_unneeded_seconds", 600),
+                    )
+                ),
+            )
+        )
+    if not pools:
+        raise ValueError("No node pools defined; check capacity/nodepools.yaml")
+    return pools
+
+
+@dataclass(eq=False)
+class Pod:
+    user: str
+    workspace: Optional[str]
+    spec: PodSpec
+    requested_at: float
+    last_activity: float
+    active_until: float = 0.0
+    node: Optional["Node"] = None
+    started_at: Optional[float] = None
+
+
+@dataclass(eq=False)
+class Node:
+    pool: NodePool
+    created_at: float
+    ready: bool
+    pods: list = field(default_factory=list)
+    cpu_used: float = 0.0
+    memory_used: int = 0
+    extra_used: dict = field(default_factory=dict)
+    removed_at: Optional[float] = None
+    empty_since: Optional[float] = None
+    # Integrals of requested resources over time, for utilisation
+    cpu_seconds: float = 0.0
+    memory_seconds: float = 0.0
+    accrued_until: float = 0.0
+
+    def fits(self, spec: PodSpec) -> bool:
+        return (
+            self.cpu_used + spec.cpu <= self.pool.cpu + 1e-9
+            and self.memory_used + spec.memory <= self.pool.memory
+            and all(
+                self.extra_used.get(k, 0) + v <= self.pool.extra.get(k, 0)
+                for k, v in spec.extra.items()
+            )
+        )
+
+    def accrue(self, now: float):
+        elapsed = now - self.accrued_until
+        self.cpu_seconds += self.cpu_used * elapsed
+        self.memory_seconds += self.memory_used * elapsed
+        self.accrued_until = now
+
+    def add(self, pod: Pod, now: float):
+        self.accrue(now)
+        self.pods.append(pod)
+        self.cpu_used += pod.spec.cpu
+        self.memory_used += pod.spec.memory
+        for k, v in pod.spec.extra.items():
+            self.extra_used[k] = self.extra_used.get(k, 0) + v
+        self.empty_since = None
+        pod.node = self
+
+    def remove(self, pod: Pod, now: float):
+        self.accrue(now)
+        self.pods.remove(pod)
+        self.cpu_used -= pod.spec.cpu
+        self.memory_used -= pod.spec.memory
+        for k, v in pod.spec.extra.items():
+            self.extra_used[k] -= v
+        pod.node = None
+
+
+# =============================================================================
+# Simulation
+# =============================================================================
+
+
+class Simulation:
+    """Discrete-event replay of a trace against one config variant.
+
+    Models the parts of z2jh and the cluster autoscaler that drive wait times
+    and node count: pods request their guarantees, the user scheduler packs
+    pods onto the fullest node (or spreads them when disabled), pending pods
+    trigger scale-up of the cheapest pool that can hold them, only empty
+    nodes are scaled down (user pods are not evictable), and the idle culler
+    stops servers inactive for longer than cull.timeout.
+    """
+
+    def __init__(self, config: dict, trace: list):
+        self.config = config
+        self.trace = trace
+        self.pools = build_nodepools(config)
+        self.pack = get_config(config, "scheduling.userScheduler.enabled", True)
+        self.start_timeout = float(get_config(config, "singleuser.startTimeout", 300))
+        self.cull_enabled = get_config(config, "cull.enabled", True)
+        self.cull_timeout = float(get_config(config, "cull.timeout", 3600))
+        self.cull_every = float(get_config(config, "cull.every", 600))
+        self.cull_max_age = float(get_config(config, "cull.maxAge", 0))
+        self._spec_cache = {}
+
+        self.now = 0.0
+        self.queue = []
+        self.seq = 0
+        self.nodes = []
+        self.pods = {}
+        self.pending = []
+
+        self.spawns = 0
+        self.warm_starts = 0
+        self.failed_spawns = 0
+        self.culled = 0
+        self.server_seconds = 0.0
+        self.waits = []
+        self.scale_ups = {pool.name: 0 for pool in self.pools}
+        self.peak_nodes = {pool.name: 0 for pool in self.pools}
+
+    def _push(self, time: float, handler, *args):
+        self.seq += 1
+        heapq.heappush(self.queue, (time, self.seq, handler, args))
+
+    def _spec(self, workspace):
+        if workspace not in self._spec_cache:
+            self._spec_cache[workspace] = build_pod_spec(self.config, workspace)
+        return self._spec_cache[workspace]
+
+    def _live_nodes(self, pool: NodePool) -> list:
+        return [n for n in self.nodes if n.pool is pool and n.removed_at is None]
+
+    def run(self, until: Optional[float] = None) -> dict:
+        """Replay the trace and report on it up to `until`.
+
+        Without `until` the replay carries on past the last trace event until
+        every server has stopped and empty nodes have been scaled down.
+        """
+        if not self.trace:
+            raise ValueError("Trace is empty")
+        start = self.trace[0].time
+        self.now = start
+
+        for pool in self.pools:
+            for _ in range(pool.min_count):
+                self._add_node(pool, ready=True)
+
+        self.trace_remaining = len(self.trace)
+        for event in self.trace:
+            self._push(event.time, self._on_trace_event, event)
+        if self.cull_enabled and self.cull_every > 0:
+            self._push(start + self.cull_every, self._on_cull_tick)
+
+        while self.queue:
+            if until is not None and self.queue[0][0] > until:
+                break
+            if until is None and self._drained():
+                break
+            self.now, _, handler, args = heapq.heappop(self.queue)
+            handler(*args)
+
+        if until is not None:
+            self.now = until
+        return self._report(start, self.now)
+
+    def _drained(self) -> bool:
+        return (
+            self.trace_remaining == 0
+            and not self.pods
+            and all(len(self._live_nodes(p)) <= p.min_count for p in self.pools)
+        )
+
+    # -- trace events ---------------------------------------------------------
+
+    def _on_trace_event(self, event: TraceEvent):
+        self.trace_remaining -= 1
+        if event.kind == "start":
+            self._on_start(event)
+        elif event.kind == "activity":
+            self._on_activity(event)
+        else:
+            self._on_stop(event)
+
+    def _on_start(self, event: TraceEvent):
+        current = self.pods.get(event.user)
+        if current is not None:
+            if current.workspace == event.workspace:
+                # Server is still running (or still spawning) in this variant
+                if current.started_at is not None:
+                    self.warm_starts += 1
+                current.last_activity = max(current.last_activity, self.now)
+                current.active_until = max(current.active_until, event.active_until)
+                return
+            self._stop_pod(current)
+
+        pod = Pod(
+            user=event.user,
+            workspace=event.workspace,
+            spec=self._spec(event.workspace),
+            requested_at=self.now,
+            last_activity=self.now,
+            active_until=event.active_until,
+        )
+        self.spawns += 1
+        self.pods[event.user] = pod
+        self.pending.append(pod)
+        self._push(self.now + self.start_timeout, self._on_start_timeout, pod)
+        self._try_place(pod)
+
+    def _on_activity(self, event: TraceEvent):
+        pod = self.pods.get(event.user)
+        if pod is not None:
+            pod.last_activity = max(pod.last_activity, event.time)
+
+    def _on_stop(self, event: TraceEvent):
+        pod = self.pods.get(event.user)
+        if pod is not None:
+            self._stop_pod(pod)
+
+    # -- internal events ------------------------------------------------------
+
+    def _on_start_timeout(self, pod: Pod):
+        if pod.started_at is None and self.pods.get(pod.user) is pod:
+            self.failed_spawns += 1
+            self._stop_pod(pod)
+
+    def _on_cull_tick(self):
+        for pod in list(self.pods.values()):
+            if pod.started_at is None:
+                continue
+            last_activity = max(pod.last_activity, min(pod.active_until, self.now))
+            idle = self.now - last_activity
+            age = self.now - pod.started_at
+            if idle >= self.cull_timeout or (
+                self.cull_max_age > 0 and age >= self.cull_max_age
+            ):
+                self.culled += 1
+                self._stop_pod(pod)
+        self._push(self.now + self.cull_every, self._on_cull_tick)
+
+    def _on_node_ready(self, node: Node):
+        node.ready = True
+        for pod in list(node.pods):
+            self._start_pod(pod)
+        if not node.pods:
+            self._mark_empty(node)
+        self._retry_pending()
+
+    def _on_scale_down_check(self, node: Node, empty_since: float):
+        pool = node.pool
+        if (
+            node.removed_at is None
+            and node.empty_since == empty_since
+            and len(self._live_nodes(pool)) > pool.min_count
+        ):
+            node.accrue(self.now)
+            node.removed_at = self.now
+
+    # -- scheduling -----------------------------------------------------------
+
+    def _add_node(self, pool: NodePool, ready: bool) -> Node:
+        node = Node(pool=pool, created_at=self.now, ready=ready, accrued_until=self.now)
+        self.nodes.append(node)
+        live = len(self._live_nodes(pool))
+        self.peak_nodes[pool.name] = max(self.peak_nodes[pool.name], live)
+        if ready:
+            self._mark_empty(node)
+        else:
+            self.scale_ups[pool.name] += 1
+            self._push(self.now + pool.scale_up_seconds, self._on_node_ready, node)
+        return node
+
+    def _mark_empty(self, node: Node):
+        node.empty_since = self.now
+        self._push(
+            self.now + node.pool.scale_down_unneeded_seconds,
+            self._on_scale_down_check,
+            node,
+            self.now,
+        )
+
+    def _best_node(self, spec: PodSpec, ready: bool) -> Optional[Node]:
+        candidates = [
+            n
+            for n in self.nodes
+            if n.removed_at is None
+            and n.ready == ready
+            and n.pool.accepts(spec)
+            and n.fits(spec)
+        ]
+        if not candidates:
+            return None
+        if self.pack:
+            return max(candidates, key=_cpu_load)
+        return min(candidates, key=_cpu_load)
+
+    def _scale_up(self, spec: PodSpec) -> Optional[Node]:
+        pools = [
+            pool
+            for pool in self.pools
+            if pool.accepts(spec) and len(self._live_nodes(pool)) < pool.max_count
+        ]
+        if not pools:
+            return None
+        pool = min(pools, key=_cost_per_hour)
+        return self._add_node(pool, ready=False)
+
+    def _try_place(self, pod: Pod):
+        node = self._best_node(pod.spec, ready=True)
+        if node is not None:
+            if pod.node is not None:
+                # Capacity freed up before the reserved node came up
+                pod.node.remove(pod, self.now)
+            node.add(pod, self.now)
+            self._start_pod(pod)
+            return
+        if pod.node is not None:
+            return
+        node = self._best_node(pod.spec, ready=False) or self._scale_up(pod.spec)
+        if node is not None:
+            node.add(pod, self.now)
+
+    def _retry_pending(self):
+        for pod in list(self.pending):
+            self._try_place(pod)
+
+    def _start_pod(self, pod: Pod):
+        pod.started_at = self.now
+        pod.last_activity = max(pod.last_activity, self.now)
+        self.waits.append(self.now - pod.requested_at)
+        self.pending.remove(pod)
+
+    def _stop_pod(self, pod: Pod):
+        del self.pods[pod.user]
+        if pod.started_at is not None:
+            self.server_seconds += self.now - pod.started_at
+        if pod in self.pending:
+            self.pending.remove(pod)
+        node = pod.node
+        if node is not None:
+            node.remove(pod, self.now)
+            if node.ready and not node.pods:
+                self._mark_empty(node)
+        self._retry_pending()
+
+    # -- reporting ------------------------------------------------------------
+
+    def _report(self, start: float, horizon: float) -> dict:
+        pools = {}
+        for pool in self.pools:
+            nodes = [n for n in self.nodes if n.pool is pool]
+            node_seconds = cpu_seconds = memory_seconds = 0.0
+            for node in nodes:
+                end = node.removed_at if node.removed_at is not None else horizon
+                node.accrue(end)
+                node_seconds += end - node.created_at
+                cpu_seconds += node.cpu_seconds
+                memory_seconds += node.memory_seconds
+            node_hours = node_seconds / 3600
+            pools[pool.name] = {
+                "scale_ups": self.scale_ups[pool.name],
+                "peak_nodes": self.peak_nodes[pool.name],
+                "node_hours": node_hours,
+                "cost": node_hours * pool.cost_per_hour,
+                "cpu_utilisation": _ratio(cpu_seconds, node_seconds * pool.cpu),
+                "memory_utilisation": _ratio(memory_seconds, node_seconds * pool.memory),
+                "_cpu_seconds": cpu_seconds,
+                "_cpu_capacity": node_seconds * pool.cpu,
+                "_memory_seconds": memory_seconds,
+                "_memory_capacity": node_seconds * pool.memory,
+            }
+
+        server_seconds = self.server_seconds + sum(
+            horizon - pod.started_at
+            for pod in self.pods.values()
+            if pod.started_at is not None
+        )
+        waits = sorted(self.waits)
+
+        def total(key):
+            return sum(pool[key] for pool in pools.values())
+
+        report = {
+            "hours_simulated": (horizon - start) / 3600,
+            "spawns": self.spawns,
+            "warm_starts": self.warm_starts,
+            "failed_spawns": self.failed_spawns,
+            "still_pending": len(self.pending),
+            "culled": self.culled,
+            "server_hours": server_seconds / 3600,
+            "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p50": percentile(waits, 50),
+            "wait_p95": percentile(waits, 95),
+            "wait_max": waits[-1] if waits else 0.0,
+            "scale_ups": total("scale_ups"),
+            "node_hours": total("node_hours"),
+            "cost": total("cost"),
+            "cpu_utilisation": _ratio(total("_cpu_seconds"), total("_cpu_capacity")),
+            "memory_utilisation": _ratio(
+                total("_memory_seconds"), total("_memory_capacity")
+            ),
+            "pools": pools,
+        }
+        for pool in pools.values():
+            for key in [k for k in pool if k.startswith("_")]:
+                del pool[key]
+        return report
+
+
+def _cpu_load(node: Node) -> float:
+    return node.cpu_used / node.pool.cpu if node.pool.cpu else 0.0
+
+
+def _cost_per_hour(pool: NodePool) -> float:
+    return pool.cost_per_hour
+
+
+def drain_time(config: dict, trace: list) -> float:
+    simulation = Simulation(config, trace)
+    simulation.run()
+    return simulation.now
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    return numerator / denominator if denominator else 0.0
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+# =============================================================================
+# Command line
+# =============================================================================
+
+
+def load_variants(path, cli_overrides: list) -> list:
+    variants = []
+    if path:
+        with open(path) as f:
+            variants = (yaml.safe_load(f) or {}).get("variants", [])
+    if not variants:
+        variants = [{"name": "baseline"}]
+    if cli_overrides:
+        overrides = {}
+        for item in cli_overrides:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"--set expects KEY=VALUE, got {item!r}")
+            overrides[key] = yaml.safe_load(value)
+        variants.append({"name": "cli", "set": overrides})
+    return variants
+
+
+def format_report(results: dict) -> str:
+    columns = [
+        ("variant", 20, None),
+        ("spawns", 7, "{:d}"),
+        ("warm", 6, "{:d}"),
+        ("failed", 7, "{:d}"),
+        ("server-hours", 13, "{:.1f}"),
+        ("wait p50", 9, "{:.0f}s"),
+        ("wait p95", 9, "{:.0f}s"),
+        ("wait max", 9, "{:.0f}s"),
+        ("scale-ups", 10, "{:d}"),
+        ("node-hours", 11, "{:.1f}"),
+        ("cost", 9, "{:.2f}"),
+        ("cpu util", 9, "{:.0%}"),
+        ("mem util", 9, "{:.0%}"),
+    ]
+    keys = [
+        "spawns",
+        "warm_starts",
+        "failed_spawns",
+        "server_hours",
+        "wait_p50",
+        "wait_p95",
+        "wait_max",
+        "scale_ups",
+        "node_hours",
+        "cost",
+        "cpu_utilisation",
+        "memory_utilisation",
+    ]
+    lines = [
+        columns[0][0].ljust(columns[0][1])
+        + "".join(name.rjust(width) for name, width, _ in columns[1:])
+    ]
+    for name, report in results.items():
+        row = name[:19].ljust(20)
+        for (_, width, fmt), key in zip(columns[1:], keys):
+            row += fmt.format(report[key]).rjust(width)
+        lines.append(row)
+        for pool_name, pool in report["pools"].items():
+            if not pool["node_hours"]:
+                continue
+            lines.append(
+                f"  - {pool_name}: {pool['scale_ups']} scale-ups, "
+                f"peak {pool['peak_nodes']} nodes, "
+                f"{pool['node_hours']:.1f} node-hours, "
+                f"{pool['cpu_utilisation']:.0%} cpu, "
+                f"{pool['memory_utilisation']:.0%} mem"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a spawn trace against LANDERHub config variants."
+    )
+    parser.add_argument("--trace", required=True, help="Recorded spawn/stop trace")
+    parser.add_argument(
+        "--trace-format",
+        choices=sorted(TRACE_READERS),
+        help="Defaults to a guess from the file extension",
+    )
+    parser.add_argument("--variants", help="YAML file of config variants to compare")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Add a variant named 'cli' with these overrides (repeatable)",
+    )
+    parser.add_argument(
+        "--values",
+        action="append",
+        type=Path,
+        help="Helm values files (defaults to cull, singleuser and workspaces)",
+    )
+    parser.add_argument("--nodepools", type=Path, default=DEFAULT_NODEPOOLS)
+    parser.add_argument(
+        "--until",
+        help="End of the simulated period (ISO 8601 or epoch seconds). Defaults "
+        "to when the slowest variant has stopped every server and scaled down",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    base_config = load_config(args.values or DEFAULT_VALUES, args.nodepools)
+    variants = load_variants(args.variants, args.set)
+
+    # Cull events without an inactive time are assumed to have hit the
+    # timeout that was deployed when the trace was recorded.
+    recorded_cull_timeout = float(get_config(base_config, "cull.timeout", 3600))
+    trace = read_trace(args.trace, args.trace_format, recorded_cull_timeout)
+
+    configs = {v["name"]: apply_overrides(base_config, v.get("set")) for v in variants}
+
+    # Cut every variant off at the same time so node-hours are comparable
+    if args.until:
+        until = parse_time(args.until)
+    else:
+        until = max(drain_time(config, trace) for config in configs.values())
+
+    results = {
+        name: Simulation(config, trace).run(until) for name, config in configs.items()
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_report(results))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import json
+
+import pytest
+
+from simulate import (
+    DEFAULT_NODEPOOLS,
+    DEFAULT_VALUES,
+    Simulation,
+    TraceEvent,
+    apply_overrides,
+    load_config,
+    mark_explicit_stops,
+    parse_time,
+    read_trace,
+)
+
+HUB_LOG = """\
+[I 2023-01-10 09:00:00.000 JupyterHub spawner:2000] User alice requested workspace 'lth-dst'.
+[I 2023-01-10 09:00:30.000 JupyterHub base:1050] User alice took 30.000 seconds to start
+[I 2023-01-10 09:10:00.000 JupyterHub spawner:2000] User bob requested workspace 'nhsx_nlp'.
+[I 2023-01-10 09:20:00.000 JupyterHub spawner:2000] User carol requested workspace 'nhsx_nlp'.
+[I 2023-01-10 09:30:10.000 JupyterHub base:1050] User dave took 10.000 seconds to start
+[I 230110 11:30:00 __init__:156] Culling server alice (inactive for 01:00:00)
+[I 2023-01-10 11:30:02.000 JupyterHub base:1100] User alice server took 1.2 seconds to stop
+[I 2023-01-10 13:00:00.000 JupyterHub base:1100] User bob server took 1.2 seconds to stop
+"""
+
+# A single small pool with no autoscaler headroom unless a test raises it
+SMALL_POOL = {
+    "singleuser": {"startTimeout": 900, "cpu": {"guarantee": 1}, "memory": {"guarantee": "1G"}},
+    "cull": {"enabled": True, "timeout": 3600, "every": 600},
+    "nodepools": {
+        "pool": {"cpu": 1, "memory": "4G", "min_count": 1, "max_count": 1},
+    },
+    "autoscaler": {"scale_up_seconds": 300, "scale_down_unneeded_seconds": 600},
+}
+
+
+def t(value):
+    return parse_time(f"2023-01-10T{value}Z")
+
+
+def events_of(trace):
+    return [(e.time, e.kind, e.user, e.workspace) for e in trace]
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return path
+
+
+def test_csv_trace(tmp_path):
+    path = write(
+        tmp_path,
+        "trace.csv",
+        "timestamp,user,event,workspace,inactive_seconds\n"
+        "2023-01-10T09:00:00Z,alice,start,lth-dst,\n"
+        "2023-01-10T11:00:00Z,alice,cull,,1800\n"
+        "2023-01-10T12:00:00Z,bob,cull,,\n",
+    )
+    trace = read_trace(path, None, cull_timeout=3600)
+    assert events_of(trace) == [
+        (t("09:00:00"), "start", "alice", "lth-dst"),
+        (t("10:30:00"), "activity", "alice", None),
+        (t("11:00:00"), "activity", "bob", None),
+    ]
+
+
+def test_jsonl_trace_marks_explicit_stops(tmp_path):
+    rows = [
+        {"timestamp": t("09:00:00"), "user": "alice", "event": "start", "workspace": "lth-dst"},
+        {"timestamp": t("17:00:00"), "user": "alice", "event": "stop"},
+    ]
+    path = write(tmp_path, "trace.jsonl", "\n".join(json.dumps(r) for r in rows))
+    start, stop = read_trace(path, None, cull_timeout=3600)
+    assert (start.kind, stop.kind) == ("start", "stop")
+    assert start.active_until == t("17:00:00")
+
+
+def test_hub_log_trace(tmp_path):
+    path = write(tmp_path, "hub.log", HUB_LOG)
+    trace = read_trace(path, None, cull_timeout=3600)
+    assert events_of(trace) == [
+        (t("09:00:00"), "start", "alice", "lth-dst"),
+        (t("09:10:00"), "start", "bob", "nhsx_nlp"),
+        # Never logged as started, but still part of the trace
+        (t("09:20:00"), "start", "carol", "nhsx_nlp"),
+        # Logs from before the workspace line fall back to the start time
+        (t("09:30:00"), "start", "dave", None),
+        # The culler's stop is left to the simulated culler
+        (t("10:30:00"), "activity", "alice", None),
+        (t("13:00:00"), "stop", "bob", None),
+    ]
+
+
+def test_users_api_trace(tmp_path):
+    snapshot = [
+        {
+            "name": "alice",
+            "servers": {
+                "": {
+                    "started": "2023-01-10T09:00:00.000000Z",
+                    "last_activity": "2023-01-10T10:00:00Z",
+                    "user_options": {"profile": "nhsx_nlp"},
+                }
+            },
+        },
+        {"name": "bob", "servers": {}},
+    ]
+    later = json.loads(json.dumps(snapshot))
+    later[0]["servers"][""]["last_activity"] = "2023-01-10T11:00:00Z"
+    path = write(tmp_path, "users.json", json.dumps(snapshot) + "\n" + json.dumps(later))
+    trace = read_trace(path, "users-api", cull_timeout=3600)
+    assert events_of(trace) == [
+        (t("09:00:00"), "start", "alice", "nhsx_nlp"),
+        (t("11:00:00"), "activity", "alice", None),
+    ]
+
+
+def test_baseline_replay_matches_recorded_sessions(tmp_path):
+    path = write(
+        tmp_path,
+        "trace.csv",
+        "timestamp,user,event,workspace\n"
+        "2023-01-10T09:00:00Z,alice,start,10_ws_advanced\n"
+        "2023-01-10T09:00:00Z,bob,start,10_ws_advanced\n"
+        "2023-01-10T17:00:00Z,alice,stop,\n"
+        "2023-01-10T17:00:00Z,bob,stop,\n",
+    )
+    config = load_config(DEFAULT_VALUES, DEFAULT_NODEPOOLS)
+    trace = read_trace(path, None, cull_timeout=3600)
+    report = Simulation(config, trace).run()
+    assert report["culled"] == 0
+    assert report["failed_spawns"] == 0
+    assert report["server_hours"] == pytest.approx(16)
+
+
+def test_hub_log_replay_matches_recorded_sessions(tmp_path):
+    path = write(tmp_path, "hub.log", HUB_LOG)
+    config = load_config(DEFAULT_VALUES, DEFAULT_NODEPOOLS)
+    trace = read_trace(path, None, cull_timeout=3600)
+
+    # bob stopped nhsx_nlp himself at 13:00 after an omoppool scale-up from 09:10
+    bob = [e for e in trace if e.user == "bob"]
+    report = Simulation(config, bob).run()
+    assert report["culled"] == 0
+    assert report["server_hours"] == pytest.approx(13 - 9 - 10 / 60 - 300 / 3600)
+
+    # Everyone else is culled an hour after their last activity
+    report = Simulation(config, trace).run()
+    assert report["culled"] == 3
+
+
+def test_raising_max_count_starts_queued_pod():
+    trace = [
+        TraceEvent(t("09:00:00"), "start", "alice"),
+        TraceEvent(t("09:00:00"), "start", "bob"),
+        TraceEvent(t("12:00:00"), "stop", "alice"),
+        TraceEvent(t("12:00:00"), "stop", "bob"),
+    ]
+    mark_explicit_stops(trace)
+
+    capped = Simulation(SMALL_POOL, trace).run()
+    assert capped["failed_spawns"] == 1
+    assert capped["scale_ups"] == 0
+
+    raised = apply_overrides(SMALL_POOL, {"nodepools.pool.max_count": 2})
+    report = Simulation(raised, trace).run()
+    assert report["failed_spawns"] == 0
+    assert report["scale_ups"] == 1
+    assert report["wait_max"] == 300
+    assert report["server_hours"] == pytest.approx(6 - 300 / 3600)
+
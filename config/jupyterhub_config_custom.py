@@ -94,6 +94,11 @@ def modify_pod_hook(spawner: KubeSpawner, pod: V1Pod):
 
         workspace = metadata.labels.get("workspace", "")
 
+        # Used by capacity/simulate.py to attribute spawns in hub logs to a workspace
+        spawner.log.info(
+            f"User {spawner.user.name} requested workspace '{workspace}'."
+        )
+
         storage = z2jh.get_config(f"custom.workspaces.{workspace}.storage")
 
         spawner.log.info(f"Attempting to mount {str(storage)}...")